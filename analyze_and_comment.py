@@ -6,99 +6,32 @@ Analyzes build failures using Google Gemini AI and posts results to GitHub PRs
 
 import os
 import sys
-import google.generativeai as genai
-from github import Github
+import json
+import asyncio
+import logging
+import httpx
 from datetime import datetime
+from log_analyzer_core import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    MAX_SCAN_BYTES,
+    LogReadError,
+    analyze_build_log,
+    cache_disabled_by_env,
+    open_analysis_output,
+    read_log_file,
+)
 
+GITHUB_API_URL = 'https://api.github.com'
+BATCH_CONCURRENCY = 8
+GITHUB_CONCURRENCY = 10
 
-def read_log_file(log_path):
-    """Read the Jenkins build log file"""
-    try:
-        with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        return content
-    except FileNotFoundError:
-        print(f"❌ Error: Log file not found at {log_path}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ Error reading log file: {e}")
-        sys.exit(1)
-
-
-def analyze_with_gemini(log_content, max_chars=30000):
-    """Analyze build log using Gemini AI"""
-    api_key = os.getenv('GEMINI_API_KEY')
-
-    if not api_key:
-        return "❌ Error: GEMINI_API_KEY environment variable not set"
-
-    # Truncate if too long (keep the end where errors usually are)
-    if len(log_content) > max_chars:
-        print(f"⚠️  Log truncated from {len(log_content)} to {max_chars} characters")
-        log_content = "...[earlier output truncated]...\n\n" + log_content[-max_chars:]
-
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-        prompt = f"""
-You are an expert DevOps engineer analyzing a Jenkins CI/CD build failure.
-
-Analyze this build log and provide a comprehensive but concise analysis:
-
-## 🔍 Root Cause
-Identify the PRIMARY reason for the build failure (1-2 sentences)
-
-## 📍 Error Location
-Point to the specific file, line number, or command that failed
-
-## 🔧 Recommended Fixes
-Provide 3-5 ACTIONABLE steps to resolve this issue:
-1. [First step with specific command or action]
-2. [Second step]
-3. [etc.]
-
-## 💡 Prevention Tips
-Suggest 2-3 best practices to prevent this issue in the future
-
-## 🔗 Relevant Documentation
-If applicable, mention relevant documentation or resources
-
-Build Log:
----
-{log_content}
----
 
-Format your response in clear Markdown suitable for a GitHub comment.
-Be technical but accessible. Focus on actionable insights.
-"""
+def github_client():
+    """HTTP/2 client for the GitHub REST API, shared across requests for keep-alive"""
+    return httpx.AsyncClient(http2=True, timeout=30.0)
 
-        print("🤖 Analyzing build log with Gemini AI...")
-        response = model.generate_content(prompt)
-        return response.text
 
-    except Exception as e:
-        error_msg = f"""
-❌ **Error during AI analysis**
-```
-{str(e)}
-```
-
-**Possible causes:**
-- API key invalid or expired
-- Network connectivity issues
-- API rate limit exceeded
-- Model unavailable
-
-**Please check:**
-1. Verify GEMINI_API_KEY is set correctly
-2. Check network connectivity
-3. Visit https://aistudio.google.com to verify API status
-"""
-        return error_msg
-
-
-def post_github_comment(repo_name, pr_number, comment_body):
+async def post_github_comment_async(client, repo_name, pr_number, comment_body):
     """Post AI analysis as a comment on the GitHub PR"""
     github_token = os.getenv('GITHUB_TOKEN')
 
@@ -107,17 +40,22 @@ def post_github_comment(repo_name, pr_number, comment_body):
         return False
 
     try:
-        # Initialize GitHub client
-        g = Github(github_token)
-        repo = g.get_repo(repo_name)
-        pr = repo.get_pull(int(pr_number))
-
-        # Create comment
-        comment = pr.create_issue_comment(comment_body)
+        # PR comments are issue comments in the REST API
+        response = await client.post(
+            f"{GITHUB_API_URL}/repos/{repo_name}/issues/{pr_number}/comments",
+            headers={
+                'Authorization': f'Bearer {github_token}',
+                'Accept': 'application/vnd.github+json',
+                'X-GitHub-Api-Version': '2022-11-28',
+            },
+            json={'body': comment_body},
+        )
+        response.raise_for_status()
+        comment = response.json()
 
         print(f"✅ Comment posted successfully to PR #{pr_number}")
-        print(f"   PR URL: {pr.html_url}")
-        print(f"   Comment URL: {comment.html_url}")
+        print(f"   PR URL: https://github.com/{repo_name}/pull/{pr_number}")
+        print(f"   Comment URL: {comment['html_url']}")
         return True
 
     except Exception as e:
@@ -127,19 +65,29 @@ def post_github_comment(repo_name, pr_number, comment_body):
         return False
 
 
-def save_analysis(analysis_text, output_path):
+def write_analysis_header(f):
+    """Write the banner that opens a saved analysis"""
+    f.write("=" * 80 + "\n")
+    f.write("🤖 AI-POWERED BUILD FAILURE ANALYSIS\n")
+    f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    f.write("=" * 80 + "\n\n")
+
+
+def write_analysis_footer(f):
+    """Write the banner that closes a saved analysis"""
+    f.write("\n\n" + "=" * 80 + "\n")
+    f.write("Analysis completed by Jenkins AI Log Analyzer\n")
+    f.write("Powered by Google Gemini AI\n")
+    f.write("=" * 80 + "\n")
+
+
+def save_analysis(analysis_text, output_path, compress=False):
     """Save the AI analysis to a file"""
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write("=" * 80 + "\n")
-            f.write("🤖 AI-POWERED BUILD FAILURE ANALYSIS\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("=" * 80 + "\n\n")
+        with open_analysis_output(output_path, compress) as f:
+            write_analysis_header(f)
             f.write(analysis_text)
-            f.write("\n\n" + "=" * 80 + "\n")
-            f.write("Analysis completed by Jenkins AI Log Analyzer\n")
-            f.write("Powered by Google Gemini AI\n")
-            f.write("=" * 80 + "\n")
+            write_analysis_footer(f)
 
         print(f"✅ Analysis saved to: {output_path}")
         return True
@@ -148,6 +96,159 @@ def save_analysis(analysis_text, output_path):
         return False
 
 
+def format_comment_body(analysis):
+    """Wrap an analysis in the PR comment header and footer"""
+    return f"""## 🤖 AI Build Failure Analysis
+
+{analysis}
+
+---
+<sub>🔬 Analysis powered by **Google Gemini AI** | 🤖 Generated by **Jenkins AI Log Analyzer**</sub>
+<sub>⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}</sub>
+"""
+
+
+async def save_and_post(analysis, output_path, repo_name, pr_number, compress=False):
+    """Save the analysis locally while posting it to GitHub; returns whether the post succeeded"""
+    async with github_client() as client:
+        _, posted = await asyncio.gather(
+            asyncio.to_thread(save_analysis, analysis, output_path, compress),
+            post_github_comment_async(client, repo_name, pr_number, format_comment_body(analysis)),
+        )
+    return posted
+
+
+def validate_job(job):
+    """Return a list of problems with a batch manifest entry"""
+    if not isinstance(job, dict):
+        return ["expected an object with log, repo and pr"]
+    problems = []
+    if not os.path.isfile(str(job.get('log', ''))):
+        problems.append(f"log file not found: {job.get('log')}")
+    if '/' not in str(job.get('repo', '')):
+        problems.append(f"invalid repository name: {job.get('repo')}")
+    if not str(job.get('pr', '')).isdigit():
+        problems.append(f"invalid PR number: {job.get('pr')}")
+    return problems
+
+
+async def analyze_job(job, post, compress=False, **analysis_options):
+    """Analyze one validated job, save it and comment on its PR; returns (analysis, output_path, posted)"""
+    log_content = await asyncio.to_thread(read_log_file, job['log'], MAX_SCAN_BYTES)
+    analysis = await asyncio.to_thread(analyze_build_log, log_content, **analysis_options)
+    output_path = job.get('out') or f"analysis-{job['repo'].replace('/', '_')}-{job['pr']}.txt"
+    if compress:
+        output_path += '.zst'
+    _, posted = await asyncio.gather(
+        asyncio.to_thread(save_analysis, analysis, output_path, compress),
+        post(job['repo'], str(job['pr']), format_comment_body(analysis)),
+    )
+    return analysis, output_path, posted
+
+
+async def run_batch(jobs, concurrency, analysis_options, compress=False):
+    """Analyze jobs concurrently; returns one success flag per job"""
+    job_slots = asyncio.Semaphore(concurrency)
+    github_slots = asyncio.Semaphore(GITHUB_CONCURRENCY)
+
+    async with github_client() as client:
+
+        async def post(repo_name, pr_number, comment_body):
+            async with github_slots:
+                return await post_github_comment_async(client, repo_name, pr_number, comment_body)
+
+        async def run_job(job):
+            label = f"{job['repo']}#{job['pr']}"
+            async with job_slots:
+                print(f"🤖 [{label}] Analyzing {job['log']}...")
+                try:
+                    _, _, posted = await analyze_job(job, post, compress, **analysis_options)
+                except LogReadError as e:
+                    print(f"❌ [{label}] {e}")
+                    return False
+                except Exception as e:
+                    # Any other failure (e.g. a locked cache database) costs this job, not the whole batch
+                    print(f"❌ [{label}] Analysis failed: {e}")
+                    return False
+                print(f"{'✅' if posted else '⚠️ '} [{label}] Done")
+                return posted
+
+        return await asyncio.gather(*(run_job(job) for job in jobs))
+
+
+def main_batch(manifest_path, concurrency=BATCH_CONCURRENCY, compress=False, **analysis_options):
+    """Analyze every job in a JSON manifest ([{"log", "repo", "pr", "out"?}, ...]) and comment on each PR"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            jobs = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"❌ Error reading batch manifest: {e}")
+        sys.exit(1)
+
+    if not isinstance(jobs, list):
+        print("❌ Error: batch manifest must be a JSON list of jobs")
+        sys.exit(1)
+
+    valid_jobs = []
+    for index, job in enumerate(jobs):
+        problems = validate_job(job)
+        if problems:
+            print(f"⚠️  Skipping job {index}: {'; '.join(problems)}")
+        else:
+            valid_jobs.append(job)
+
+    print(f"📋 Running {len(valid_jobs)} job(s) with concurrency {concurrency}")
+    print()
+    results = asyncio.run(run_batch(valid_jobs, concurrency, analysis_options, compress))
+
+    print()
+    print("=" * 80)
+    print("📊 BATCH SUMMARY")
+    print("=" * 80)
+    print(f"   Commented: {sum(results)}/{len(jobs)}")
+    print(f"   Skipped:   {len(jobs) - len(valid_jobs)}")
+    print(f"   Failed:    {len(results) - sum(results)}")
+    print("=" * 80)
+    print()
+    return len(valid_jobs) == len(jobs) and all(results)
+
+
+def parse_cli_options(argv):
+    """Split command line into positional arguments and --options"""
+    args = []
+    options = {
+        'no_cache': False,
+        'similarity_threshold': DEFAULT_SIMILARITY_THRESHOLD,
+        'use_context_cache': False,
+        'compress': False,
+        'concurrency': BATCH_CONCURRENCY,
+    }
+    argv = iter(argv)
+    for arg in argv:
+        if arg == '--no-cache':
+            options['no_cache'] = True
+        elif arg == '--use-context-cache':
+            options['use_context_cache'] = True
+        elif arg == '--compress':
+            options['compress'] = True
+        elif arg == '--concurrency':
+            value = next(argv, None)
+            if value is None or not value.isdigit() or int(value) < 1:
+                print(f"❌ Error: --concurrency expects a positive integer, got '{value}'")
+                sys.exit(1)
+            options['concurrency'] = int(value)
+        elif arg == '--similarity-threshold':
+            value = next(argv, None)
+            try:
+                options['similarity_threshold'] = float(value)
+            except (TypeError, ValueError):
+                print(f"❌ Error: --similarity-threshold expects a number, got '{value}'")
+                sys.exit(1)
+        else:
+            args.append(arg)
+    return args, options
+
+
 def main():
     """Main execution flow"""
 
@@ -155,24 +256,45 @@ def main():
     print("🚀 JENKINS AI LOG ANALYZER WITH GITHUB INTEGRATION")
     print("=" * 80 + "\n")
 
+    logging.basicConfig(level=os.getenv('LOG_ANALYZER_LOG_LEVEL', 'WARNING').upper())
+
     # Parse command line arguments
-    if len(sys.argv) < 4:
+    args, options = parse_cli_options(sys.argv[1:])
+    use_cache = not (options['no_cache'] or cache_disabled_by_env())
+
+    if len(args) == 2 and args[0] == 'batch':
+        ok = main_batch(args[1], concurrency=options['concurrency'], compress=options['compress'], use_cache=use_cache,
+                        similarity_threshold=options['similarity_threshold'],
+                        use_context_cache=options['use_context_cache'])
+        sys.exit(0 if ok else 1)
+
+    if len(args) < 3:
         print("❌ Insufficient arguments\n")
         print("Usage:")
-        print("  python3 analyze_and_comment.py <log_file> <repo_name> <pr_number> [output_file]\n")
+        print("  python3 analyze_and_comment.py <log_file> <repo_name> <pr_number> [output_file] [options]")
+        print("  python3 analyze_and_comment.py batch <jobs.json> [--concurrency N] [options]\n")
         print("Arguments:")
         print("  log_file    : Path to Jenkins build log (e.g., build_log.txt)")
         print("  repo_name   : GitHub repository in format 'owner/repo'")
         print("  pr_number   : Pull request number")
-        print("  output_file : (Optional) Path for analysis output (default: analysis.txt)\n")
+        print("  output_file : (Optional) Path for analysis output (default: analysis.txt)")
+        print("  jobs.json   : Batch manifest, a JSON list of {\"log\", \"repo\", \"pr\", \"out\" (optional)}\n")
+        print("Options:")
+        print("  --no-cache               : Always call Gemini, ignoring cached analyses (or set LOG_ANALYZER_NO_CACHE=1)")
+        print("  --similarity-threshold X : Reuse the analysis of a similar earlier log below cosine distance X")
+        print("                             (default: 0.15, 0 disables similarity matching)")
+        print("  --use-context-cache      : Keep the analysis instructions in a Gemini context cache")
+        print("                             (reused for 5 minutes, falls back to a normal request on error)")
+        print("  --compress               : Write analyses zstd-compressed, appending .zst to the output file name")
+        print("  --concurrency N          : Batch mode only, number of jobs analyzed at once (default: 8)\n")
         print("Example:")
         print("  python3 analyze_and_comment.py build_log.txt rishalgawade/jenkins-ai-log-analyzer 5\n")
         sys.exit(1)
 
-    log_file = sys.argv[1]
-    repo_name = sys.argv[2]
-    pr_number = sys.argv[3]
-    output_file = sys.argv[4] if len(sys.argv) > 4 else "analysis.txt"
+    log_file = args[0]
+    repo_name = args[1]
+    pr_number = args[2]
+    output_file = args[3] if len(args) > 3 else "analysis.txt"
 
     # Validate inputs
     if '/' not in repo_name:
@@ -190,50 +312,43 @@ def main():
     print(f"   Log File: {log_file}")
     print(f"   Repository: {repo_name}")
     print(f"   PR Number: #{pr_number}")
+    if options['compress']:
+        output_file += '.zst'
     print(f"   Output File: {output_file}")
+    print(f"   Response Cache: {'enabled' if use_cache else 'disabled'}")
     print()
 
     # Step 1: Read build log
     print("📄 Step 1: Reading build log...")
-    log_content = read_log_file(log_file)
-    print(f"✅ Log file read successfully ({len(log_content):,} characters)")
+    try:
+        log_content = read_log_file(log_file, max_bytes=MAX_SCAN_BYTES)
+    except LogReadError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Log file read successfully ({os.path.getsize(log_file):,} bytes, "
+          f"analyzing the last {len(log_content):,} characters)")
     print()
 
-    # Step 2: Analyze with AI
+    # Step 2: Analyze with AI; the report is printed once the analysis is complete
     print("🤖 Step 2: Analyzing with Gemini AI...")
-    analysis = analyze_with_gemini(log_content)
+    analysis = analyze_build_log(log_content, use_cache=use_cache,
+                                 similarity_threshold=options['similarity_threshold'],
+                                 use_context_cache=options['use_context_cache'],
+                                 sinks=[sys.stdout])
+    print("\n")
     print("✅ AI analysis completed")
     print()
 
-    # Step 3: Save analysis locally
-    print("💾 Step 3: Saving analysis...")
-    save_analysis(analysis, output_file)
-    print()
-
-    # Step 4: Post to GitHub PR
-    print(f"📝 Step 4: Posting comment to GitHub PR #{pr_number}...")
-
-    # Format comment with header and footer
-    comment_body = f"""## 🤖 AI Build Failure Analysis
-
-{analysis}
+    # Step 3: Save the report and post it to the GitHub PR at the same time
+    print(f"📝 Step 3: Saving analysis and posting comment to GitHub PR #{pr_number}...")
 
----
-<sub>🔬 Analysis powered by **Google Gemini AI** | 🤖 Generated by **Jenkins AI Log Analyzer**</sub>
-<sub>⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}</sub>
-"""
-
-    success = post_github_comment(repo_name, pr_number, comment_body)
+    success = asyncio.run(save_and_post(analysis, output_file, repo_name, pr_number, options['compress']))
     print()
 
-    # Step 5: Display summary
+    # Step 4: Display summary
     print("=" * 80)
     print("📊 ANALYSIS SUMMARY")
     print("=" * 80)
-    print()
-    print(analysis)
-    print()
-    print("=" * 80)
 
     if success:
         print("✅ All operations completed successfully!")
@@ -6,138 +6,48 @@ Analyzes build failures without GitHub integration
 
 import os
 import sys
-import google.generativeai as genai
+import logging
+from contextlib import contextmanager
 from datetime import datetime
-
-
-def read_log_file(log_path):
-    """Read the build log file"""
-    try:
-        with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        return content
-    except FileNotFoundError:
-        print(f"❌ Error: Log file not found at {log_path}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"❌ Error reading log file: {e}")
-        sys.exit(1)
-
-
-def analyze_with_gemini(log_content, max_chars=30000):
-    """Send log content to Gemini API for analysis"""
-    api_key = os.getenv('GEMINI_API_KEY')
-
-    if not api_key:
-        return "❌ Error: GEMINI_API_KEY environment variable not set"
-
-    # Truncate log if too long (keep the end where errors usually appear)
-    if len(log_content) > max_chars:
-        print(f"⚠️  Log truncated from {len(log_content):,} to {max_chars:,} characters")
-        log_content = "...[earlier output truncated]...\n\n" + log_content[-max_chars:]
-
+from log_analyzer_core import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    MAX_SCAN_BYTES,
+    LogReadError,
+    analyze_build_log,
+    cache_disabled_by_env,
+    open_analysis_output,
+    read_log_file,
+)
+
+
+@contextmanager
+def open_report_file(output_path, compress=False):
+    """Open the analysis file between its header and footer; yields None if it cannot be created"""
     try:
-        # Configure Gemini API
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-
-        # Craft the analysis prompt
-        prompt = f"""
-You are an expert DevOps engineer analyzing a Jenkins CI/CD build failure log.
-
-Your task is to analyze this build log and provide:
-
-## 🔍 Root Cause
-Identify the PRIMARY reason for the build failure. Be specific and concise (2-3 sentences).
-
-## 📍 Error Location
-Point to the exact file, line number, command, or stage where the failure occurred.
-Include the actual error message if present.
-
-## 🔧 Recommended Fixes
-Provide 3-5 ACTIONABLE steps to resolve this issue:
-1. [First concrete step with specific commands if applicable]
-2. [Second step]
-3. [Third step]
-etc.
-
-## 💡 Prevention Tips
-Suggest 2-3 best practices to prevent this issue in the future.
-
-## 🔗 Additional Resources
-If applicable, mention relevant documentation links or related issues.
-
-Build Log to Analyze:
----
-{log_content}
----
-
-IMPORTANT:
-- Be technical but clear
-- Focus on actionable insights
-- Use bullet points for readability
-- Include code examples when relevant
-- Format response in clean Markdown
-"""
+        f = open_analysis_output(output_path, compress)
+    except OSError as e:
+        print(f"❌ Error saving analysis: {e}")
+        f = None
 
-        print("🤖 Analyzing build log with Gemini AI...")
-        response = model.generate_content(prompt)
-
-        return response.text
-
-    except Exception as e:
-        error_analysis = f"""
-❌ **Error During AI Analysis**
-```
-{str(e)}
-```
-
-**Possible Causes:**
-- Invalid or expired API key
-- Network connectivity issues  
-- API rate limit exceeded
-- Gemini service temporarily unavailable
-
-**Troubleshooting Steps:**
-1. Verify GEMINI_API_KEY environment variable is set correctly
-2. Check your API key at: https://aistudio.google.com/app/apikey
-3. Ensure you have internet connectivity
-4. Check Gemini API status
-5. Review API usage limits on your account
-
-**Manual Log Review:**
-Please review the build log manually to identify:
-- Error messages (lines containing "ERROR", "FAILED", "Exception")
-- Exit codes (non-zero values)
-- Stack traces
-- Missing dependencies
-"""
-        return error_analysis
+    if f is None:
+        yield None
+        return
 
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-def save_analysis(analysis_text, output_path):
-    """Save the AI analysis to a file"""
-    try:
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write("=" * 80 + "\n")
-            f.write("🤖 AI-POWERED BUILD FAILURE ANALYSIS\n")
-            f.write("=" * 80 + "\n")
-            f.write(f"Generated: {timestamp}\n")
-            f.write(f"Analyzer: Jenkins AI Log Analyzer\n")
-            f.write(f"AI Model: Google Gemini 2.0 Flash\n")
-            f.write("=" * 80 + "\n\n")
-            f.write(analysis_text)
-            f.write("\n\n" + "=" * 80 + "\n")
-            f.write("End of Analysis\n")
-            f.write("=" * 80 + "\n")
-
-        print(f"✅ Analysis saved to: {output_path}")
-        return True
-    except Exception as e:
-        print(f"❌ Error saving analysis: {e}")
-        return False
+    with f:
+        f.write("=" * 80 + "\n")
+        f.write("🤖 AI-POWERED BUILD FAILURE ANALYSIS\n")
+        f.write("=" * 80 + "\n")
+        f.write(f"Generated: {timestamp}\n")
+        f.write(f"Analyzer: Jenkins AI Log Analyzer\n")
+        f.write(f"AI Model: Google Gemini 2.0 Flash\n")
+        f.write("=" * 80 + "\n\n")
+        yield f
+        f.write("\n\n" + "=" * 80 + "\n")
+        f.write("End of Analysis\n")
+        f.write("=" * 80 + "\n")
+    print(f"✅ Analysis saved to: {output_path}")
 
 
 def display_help():
@@ -152,15 +62,27 @@ DESCRIPTION:
     root cause analysis, error location, recommended fixes, and prevention tips.
 
 USAGE:
-    python3 analyze_log.py <log_file> [output_file]
+    python3 analyze_log.py <log_file> [output_file] [options]
 
 ARGUMENTS:
     log_file     (required)  Path to the Jenkins build log file
     output_file  (optional)  Path for analysis output (default: analysis.txt)
 
+OPTIONS:
+    --no-cache               Always call Gemini, ignoring cached analyses
+    --similarity-threshold X Reuse the analysis of a similar earlier log when the
+                             cosine distance of their embeddings is below X
+                             (default: 0.15, 0 disables similarity matching)
+    --use-context-cache      Keep the analysis instructions in a Gemini context
+                             cache so only the log is sent on repeated runs
+                             (reused for 5 minutes, falls back on error)
+    --compress               Write the analysis zstd-compressed to <output_file>.zst
+
 ENVIRONMENT VARIABLES:
     GEMINI_API_KEY  (required)  Your Google Gemini API key
                                 Get from: https://aistudio.google.com/app/apikey
+    LOG_ANALYZER_NO_CACHE       Set to 1 to disable the response cache
+    LOG_ANALYZER_CACHE_DIR      Cache location (default: ~/.cache/ai-log-analyzer)
 
 EXAMPLES:
     # Basic usage
@@ -174,7 +96,7 @@ EXAMPLES:
 
 REQUIREMENTS:
     - Python 3.8 or higher
-    - google-generativeai package (install: pip install google-generativeai)
+    - Packages from requirements.txt (install: pip install -r requirements.txt)
     - Valid Gemini API key
 
 OUTPUT:
@@ -192,6 +114,35 @@ For more information, visit:
     print(help_text)
 
 
+def parse_cli_options(argv):
+    """Split command line into positional arguments and --options"""
+    args = []
+    options = {
+        'no_cache': False,
+        'similarity_threshold': DEFAULT_SIMILARITY_THRESHOLD,
+        'use_context_cache': False,
+        'compress': False,
+    }
+    argv = iter(argv)
+    for arg in argv:
+        if arg == '--no-cache':
+            options['no_cache'] = True
+        elif arg == '--use-context-cache':
+            options['use_context_cache'] = True
+        elif arg == '--compress':
+            options['compress'] = True
+        elif arg == '--similarity-threshold':
+            value = next(argv, None)
+            try:
+                options['similarity_threshold'] = float(value)
+            except (TypeError, ValueError):
+                print(f"❌ Error: --similarity-threshold expects a number, got '{value}'")
+                sys.exit(1)
+        else:
+            args.append(arg)
+    return args, options
+
+
 def main():
     """Main execution flow"""
 
@@ -205,8 +156,12 @@ def main():
     print("🔍 JENKINS BUILD LOG ANALYZER")
     print("=" * 80 + "\n")
 
+    logging.basicConfig(level=os.getenv('LOG_ANALYZER_LOG_LEVEL', 'WARNING').upper())
+
+    args, options = parse_cli_options(sys.argv[1:])
+
     # Validate arguments
-    if len(sys.argv) < 2:
+    if len(args) < 1:
         print("❌ Error: Missing required argument\n")
         print("Usage: python3 analyze_log.py <log_file> [output_file]\n")
         print("Examples:")
@@ -215,13 +170,17 @@ def main():
         print("For more help, run: python3 analyze_log.py --help\n")
         sys.exit(1)
 
-    log_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else "analysis.txt"
+    log_file = args[0]
+    output_file = args[1] if len(args) > 1 else "analysis.txt"
+    use_cache = not (options['no_cache'] or cache_disabled_by_env())
 
     # Display configuration
     print("📋 Configuration:")
     print(f"   Input Log:  {log_file}")
+    if options['compress']:
+        output_file += '.zst'
     print(f"   Output File: {output_file}")
+    print(f"   Response Cache: {'enabled' if use_cache else 'disabled'}")
     print()
 
     # Check if API key is set
@@ -232,38 +191,36 @@ def main():
         print()
 
     # Step 1: Read the log file
-    print("📄 Step 1/4: Reading build log...")
-    log_content = read_log_file(log_file)
-    log_size = len(log_content)
+    print("📄 Step 1/2: Reading build log...")
+    try:
+        log_content = read_log_file(log_file, max_bytes=MAX_SCAN_BYTES)
+    except LogReadError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    log_size = os.path.getsize(log_file)
     print(f"✅ Log file read successfully")
-    print(f"   Size: {log_size:,} characters ({log_size / 1024:.2f} KB)")
+    print(f"   Size: {log_size:,} bytes ({log_size / 1024:.2f} KB)")
+    print(f"   Tail read: {len(log_content):,} characters")
     print()
 
-    # Step 2: Analyze with Gemini AI
-    print("🤖 Step 2/4: Analyzing with Gemini AI...")
-    print("   This may take 10-30 seconds...")
-    analysis = analyze_with_gemini(log_content)
+    # Step 2: Analyze with Gemini AI; the finished report goes to the console and the output file
+    print("🤖 Step 2/2: Analyzing with Gemini AI...")
+    print("   The report is shown and saved to the output file once the analysis is complete")
+    with open_report_file(output_file, options['compress']) as out:
+        save_success = out is not None
+        print("=" * 80)
+        analyze_build_log(log_content, use_cache=use_cache,
+                          similarity_threshold=options['similarity_threshold'],
+                          use_context_cache=options['use_context_cache'],
+                          sinks=[sink for sink in (sys.stdout, out) if sink])
+        print("\n" + "=" * 80)
     print("✅ AI analysis completed")
-    print()
-
-    # Step 3: Save analysis to file
-    print("💾 Step 3/4: Saving analysis...")
-    save_success = save_analysis(analysis, output_file)
-    print()
-
-    # Step 4: Display analysis in console
-    print("📊 Step 4/4: Displaying results")
-    print("=" * 80)
-    print("AI ANALYSIS RESULTS")
-    print("=" * 80 + "\n")
-    print(analysis)
-    print("\n" + "=" * 80)
 
     # Summary
     print("\n✅ Analysis Complete!")
     if save_success:
         print(f"   📁 Full report saved to: {output_file}")
-    print(f"   📏 Original log size: {log_size:,} characters")
+    print(f"   📏 Original log size: {log_size:,} bytes")
     print(f"   🤖 AI model used: Gemini 2.0 Flash")
     print("=" * 80 + "\n")
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Jenkins AI Log Analyzer Service
+Keeps the analyzer loaded in one long-running process so Jenkins can POST failed
+builds to it instead of paying interpreter start-up and client setup every time
+"""
+
+import os
+import hmac
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException
+from pydantic import BaseModel
+
+import analyze_and_comment as analyzer
+import log_analyzer_core as core
+
+SERVICE_HOST = os.getenv('LOG_ANALYZER_SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.getenv('LOG_ANALYZER_SERVICE_PORT', '8787'))
+# Callers must send "Authorization: Bearer <token>"; the service refuses to start without one
+SERVICE_TOKEN = os.getenv('LOG_ANALYZER_SERVICE_TOKEN', '')
+# Logs are read from, and reports written to, only these directories (os.pathsep separated)
+SERVICE_ROOTS = [os.path.realpath(root) for root in
+                 os.getenv('LOG_ANALYZER_SERVICE_ROOTS', os.getcwd()).split(os.pathsep) if root]
+
+
+class AnalyzeRequest(BaseModel):
+    """One failed build: a log on this host and the PR to comment on"""
+    log: str
+    repo: str
+    pr: int
+    out: Optional[str] = None
+    no_cache: bool = False
+    similarity_threshold: float = core.DEFAULT_SIMILARITY_THRESHOLD
+    use_context_cache: bool = False
+    compress: bool = False
+
+
+def resolve_path(path):
+    """Resolve symlinks and .. in path; None unless it lies inside one of SERVICE_ROOTS"""
+    resolved = os.path.realpath(path)
+    for root in SERVICE_ROOTS:
+        if os.path.commonpath([root, resolved]) == root:
+            return resolved
+    return None
+
+
+def check_token(authorization):
+    """Reject requests without the shared service token"""
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode('utf-8'), SERVICE_TOKEN.encode('utf-8')):
+        raise HTTPException(status_code=401, detail="missing or invalid service token")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Configure Gemini, open the response cache and the GitHub connection pool once per process"""
+    if not SERVICE_TOKEN:
+        raise RuntimeError("LOG_ANALYZER_SERVICE_TOKEN must be set to run the analyzer service")
+    api_key = os.getenv('GEMINI_API_KEY')
+    if api_key:
+        core.configure_gemini(api_key)
+    else:
+        print("⚠️  Warning: GEMINI_API_KEY environment variable not set!")
+    if not os.getenv('GITHUB_TOKEN'):
+        print("⚠️  Warning: GITHUB_TOKEN environment variable not set!")
+    core.get_response_cache()
+
+    async with analyzer.github_client() as client:
+        app.state.github = client
+        app.state.github_slots = asyncio.Semaphore(analyzer.GITHUB_CONCURRENCY)
+        print(f"🚀 Analyzer service listening on http://{SERVICE_HOST}:{SERVICE_PORT}")
+        print(f"   Allowed directories: {', '.join(SERVICE_ROOTS)}")
+        yield
+
+
+app = FastAPI(title="Jenkins AI Log Analyzer", lifespan=lifespan)
+
+
+@app.post('/analyze')
+async def analyze(request: AnalyzeRequest, authorization: Optional[str] = Header(None)):
+    """Analyze the log, save the report and comment on the PR; responds once all of it is done"""
+    check_token(authorization)
+    # Without an explicit output path the report goes to the first allowed directory
+    out = request.out or os.path.join(
+        SERVICE_ROOTS[0], f"analysis-{request.repo.replace('/', '_')}-{request.pr}.txt")
+    job = {'log': resolve_path(request.log), 'repo': request.repo, 'pr': request.pr, 'out': resolve_path(out)}
+    if job['out'] and request.compress and not resolve_path(job['out'] + '.zst'):
+        job['out'] = None
+    problems = [f"{name} is outside the allowed directories: {path}"
+                for name, path in (('log', request.log), ('out', out)) if job[name] is None]
+    if not problems:
+        problems = analyzer.validate_job(job)
+    if problems:
+        raise HTTPException(status_code=400, detail=problems)
+
+    async def post(repo_name, pr_number, comment_body):
+        async with app.state.github_slots:
+            return await analyzer.post_github_comment_async(app.state.github, repo_name, pr_number, comment_body)
+
+    label = f"{request.repo}#{request.pr}"
+    print(f"🤖 [{label}] Analyzing {request.log}...")
+    try:
+        analysis, output_path, posted = await analyzer.analyze_job(
+            job, post, request.compress,
+            use_cache=not (request.no_cache or core.cache_disabled_by_env()),
+            similarity_threshold=request.similarity_threshold,
+            use_context_cache=request.use_context_cache,
+        )
+    except core.LogReadError as e:
+        print(f"❌ [{label}] {e}")
+        raise HTTPException(status_code=400, detail=[str(e)])
+    print(f"{'✅' if posted else '⚠️ '} [{label}] Done")
+    return {'analysis': analysis, 'output': output_path, 'posted': posted}
+
+
+if __name__ == "__main__":
+    # One worker: the Gemini rate limiter and template lock are per process, jobs run in threads
+    uvicorn.run(app, host=SERVICE_HOST, port=SERVICE_PORT)
@@ -0,0 +1,758 @@
+"""
+Shared analysis pipeline for the Jenkins AI Log Analyzer scripts
+Used by analyze_log.py and analyze_and_comment.py
+"""
+
+import io
+import os
+import re
+import json
+import time
+import math
+import bisect
+import sqlite3
+import hashlib
+import logging
+import functools
+import tempfile
+import threading
+import diskcache
+import zstandard
+import google.generativeai as genai
+from google.api_core.exceptions import NotFound, PermissionDenied, ResourceExhausted
+from google.generativeai import caching
+from array import array
+from collections import deque
+from contextlib import closing
+from datetime import datetime, timedelta
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+
+MODEL_NAME = 'gemini-2.0-flash-exp'
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '15'))
+GEMINI_MAX_ATTEMPTS = 6
+CACHE_DIR = os.path.expanduser(os.getenv('LOG_ANALYZER_CACHE_DIR', '~/.cache/ai-log-analyzer'))
+SEMANTIC_CACHE_PATH = os.path.join(CACHE_DIR, 'semantic.sqlite3')
+SEMANTIC_CACHE_MAX_ROWS = 2000  # lookups scan every row, so only the newest are kept
+EMBEDDING_MODEL = 'models/text-embedding-004'
+EMBEDDING_INPUT_CHARS = 8000
+DEFAULT_SIMILARITY_THRESHOLD = 0.15
+ZSTD_LEVEL = 10
+MAX_LOG_CHARS = 30000
+MAX_PROMPT_TOKENS = 8000
+MAX_SCAN_BYTES = 8 * 1024 * 1024
+ERROR_CONTEXT_LINES = 25
+HEAD_TAIL_CHARS = 2000
+CONTEXT_CACHE_TTL = timedelta(minutes=5)
+CONTEXT_CACHE_REFRESH = timedelta(minutes=1)  # extend the TTL this long before it runs out
+TEMPLATE_REVISION_INTERVAL = 10
+MAX_SIGNATURE_LINES = 8
+
+# Parts of a log line that differ between otherwise identical failures
+VOLATILE_PATTERNS = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ][\d:.,]+(?:Z|[+-]\d{2}:?\d{2})?'), '<timestamp>'),
+    (re.compile(r'\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b'), '<time>'),
+    (re.compile(r'0x[0-9a-fA-F]+'), '<hex>'),
+    (re.compile(r'\b[0-9a-f]{7,64}\b'), '<hash>'),
+    (re.compile(r'(?i)\b(build|job|pid|run)([\s#:=]+)\d+'), r'\1\2<n>'),
+    (re.compile(r'#\d+\b'), '#<n>'),
+]
+
+# Lines worth showing to the model, with surrounding context
+ERROR_LINE_PATTERN = re.compile(r'(?i)error|failed|exception|traceback|fatal|\bE\d+:')
+NEWLINE_PATTERN = re.compile(r'\n')
+DIGITS_PATTERN = re.compile(r'\d+')
+# Stack frames and compiler locations (File "a.py", line 10 / Foo.java:42 / main.go:7 / app.js:3:14)
+SOURCE_LOCATION_PATTERN = re.compile(r'File "[^"]+", line \d+|\S\.\w{1,6}:\d+')
+
+# Lines that identify *what* failed for common CI tools, most specific first
+ERROR_SIGNATURE_PATTERNS = [
+    re.compile(r'^(?:FAILED|ERROR) (\S+::\S+)', re.M),                          # pytest summary
+    re.compile(r'^E\s+(\w+(?:Error|Exception)\b.*)$', re.M),                     # pytest assertion
+    re.compile(r'^\[ERROR\] (Failed to execute goal \S+)', re.M),                # Maven
+    re.compile(r'^\[ERROR\] (\S+\.java:\[\d+,\d+\] .*)$', re.M),                 # javac via Maven
+    re.compile(r'^\[ERROR\]\s+(\w+Tests?\.\w+:\d+.*)$', re.M),                   # surefire failure
+    re.compile(r"^\* What went wrong:\s*\n(Execution failed for task '[^']+')", re.M),  # Gradle
+    re.compile(r'^> Task (\S+) FAILED', re.M),                                   # Gradle
+    re.compile(r'^npm ERR! (?!code |errno |A complete log|This is probably)(\S.*)$', re.M),  # npm
+    re.compile(r'^--- FAIL: (\S+)', re.M),                                       # go test
+    re.compile(r'^(FAIL\s+\S+)', re.M),                                          # go test package
+    re.compile(r'^(\S+:\d+:(?:\d+:)? (?:fatal )?error: .*)$', re.M),                # gcc / clang
+    re.compile(r'^\s*((?:[\w.]+\.)?\w*(?:Error|Exception)\b:?.*)$', re.M),        # tracebacks, generic
+]
+
+# Logs that need no model call: a green build, the OOM killer, or a network flake with no test failures
+SUCCESS_LINE_PATTERN = re.compile(
+    r'^.*(?:BUILD SUCCESS(?:FUL)?\b|Finished: SUCCESS\b|(?i:\b0 failures, 0 errors\b)|Tests run: \d+, Failures: 0, Errors: 0\b).*$',
+    re.M)
+# What may follow the success marker of a run that is not over yet: Jenkins step markup and the analyzer itself
+SUCCESS_TRAILER_PATTERN = re.compile(
+    r'\s*$|\s*\[Pipeline\] |\s*\+ .*\b(?:analyze_log|analyze_and_comment|request_analysis)\.py\b')
+BUILD_FAILURE_PATTERN = re.compile(
+    r'BUILD FAIL|Finished: (?:FAILURE|UNSTABLE|ABORTED)|script returned exit code [1-9]|^ERROR:'
+    r'|(?i:\b[1-9]\d* (?:failed|failures?|errors?)\b)', re.M)
+OOM_LINE_PATTERN = re.compile(
+    r'^.*(?:Out of memory: Kill|Killed process \d+|OOMKilled|java\.lang\.OutOfMemoryError|JavaScript heap out of memory'
+    r'|Cannot allocate memory|exit code 137\b).*$', re.M)
+NETWORK_LINE_PATTERN = re.compile(
+    r'^.*(?:Connection timed out|Read timed out|connect timed out|ETIMEDOUT|ECONNRESET|ECONNREFUSED|Connection reset by peer'
+    r'|Could not resolve host|Temporary failure in name resolution|TLS handshake timeout|i/o timeout).*$', re.M)
+TEST_FAILURE_PATTERN = re.compile(
+    r'^(?:FAILED|ERROR) \S+::|^--- FAIL:|^E\s+\w+Error\b|Tests run: \d+, Failures: [1-9]|Errors: [1-9]|\.java:\[\d+,\d+\]'
+    r'|AssertionError|\b[1-9]\d* (?:tests? )?failed\b', re.M)
+
+SYSTEM_INSTRUCTIONS = """You are an expert DevOps engineer analyzing a Jenkins CI/CD build failure.
+
+Analyze the build log you are given and provide a comprehensive but concise analysis:
+
+- root_cause: the PRIMARY reason for the build failure (1-2 sentences)
+- error_location: the specific file, line number, or command that failed
+- fixes: 3-5 ACTIONABLE steps to resolve this issue, each with a specific command or action
+- prevention: 2-3 best practices to prevent this issue in the future
+- refs: relevant documentation or resources, if applicable (may be empty)
+
+Be technical but accessible. Focus on actionable insights.
+Markdown (inline code, code blocks) may be used inside the values.
+"""
+
+# Structured response; Markdown is rendered locally by render_analysis()
+ANALYSIS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'root_cause': {'type': 'STRING'},
+        'error_location': {'type': 'STRING'},
+        'fixes': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'prevention': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'refs': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+    },
+    'required': ['root_cause', 'error_location', 'fixes', 'prevention'],
+}
+GENERATION_CONFIG = {'response_mime_type': 'application/json', 'response_schema': ANALYSIS_SCHEMA}
+
+logger = logging.getLogger(__name__)
+_response_cache = None
+_context_cached_model = None  # (model, monotonic time at which its TTL must be extended)
+_context_cache_failed = False  # set once creation fails, so later jobs skip the round-trip
+_gemini_request_times = deque()
+_gemini_rate_lock = threading.Lock()
+
+
+class LogReadError(Exception):
+    """The build log could not be read"""
+
+
+def get_response_cache():
+    """Return the persistent Gemini response cache (opened on first use)"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = diskcache.Cache(CACHE_DIR)
+    return _response_cache
+
+
+def compress_text(text):
+    """zstd-compress a cache entry (compressors are not thread-safe, so one per call)"""
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(text.encode('utf-8'))
+
+
+def decompress_text(value):
+    """Inverse of compress_text; entries cached before compression are returned as-is"""
+    if isinstance(value, str):
+        return value
+    return zstandard.ZstdDecompressor().decompress(value).decode('utf-8')
+
+
+def open_analysis_output(output_path, compress=False):
+    """Open the analysis file for writing text, zstd-compressed when compress is set"""
+    if not compress:
+        return open(output_path, 'w', encoding='utf-8')
+    writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(output_path, 'wb'))
+    return io.TextIOWrapper(writer, encoding='utf-8')
+
+
+def cache_disabled_by_env():
+    """Check the LOG_ANALYZER_NO_CACHE environment variable"""
+    return os.getenv('LOG_ANALYZER_NO_CACHE', '').lower() in ('1', 'true', 'yes')
+
+
+def response_cache_key(model_name, prompt):
+    """Exact-match cache key for a (model, prompt) pair"""
+    return hashlib.sha256((model_name + "\x00" + prompt).encode('utf-8')).hexdigest()
+
+
+def _context_cache_id_path():
+    """Per-model/instructions file remembering the server-side cache name between runs"""
+    digest = hashlib.sha256((MODEL_NAME + "\x00" + SYSTEM_INSTRUCTIONS).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'.gemini_cache_id-{digest}')
+
+
+def get_context_cached_model():
+    """Model whose SYSTEM_INSTRUCTIONS live in a Gemini CachedContent, kept alive while it is in use"""
+    global _context_cached_model
+    if _context_cached_model is not None and time.monotonic() < _context_cached_model[1]:
+        return _context_cached_model[0]
+
+    cache_id_path = _context_cache_id_path()
+    try:
+        with open(cache_id_path, 'r', encoding='utf-8') as f:
+            cache = caching.CachedContent.get(f.read().strip())
+        cache.update(ttl=CONTEXT_CACHE_TTL)
+    except Exception as e:
+        # No remembered cache, or it has expired on the server
+        logger.debug("Creating new context cache: %s", e)
+        cache = caching.CachedContent.create(
+            model=f'models/{MODEL_NAME}',
+            system_instruction=SYSTEM_INSTRUCTIONS,
+            ttl=CONTEXT_CACHE_TTL,
+        )
+        with open(cache_id_path, 'w', encoding='utf-8') as f:
+            f.write(cache.name)
+
+    model = genai.GenerativeModel.from_cached_content(cached_content=cache, generation_config=GENERATION_CONFIG)
+    _context_cached_model = (model, time.monotonic() + (CONTEXT_CACHE_TTL - CONTEXT_CACHE_REFRESH).total_seconds())
+    return model
+
+
+@functools.lru_cache(maxsize=None)
+def configure_gemini(api_key):
+    """Configure the Gemini client once per process"""
+    genai.configure(api_key=api_key)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_model(model_name):
+    return genai.GenerativeModel(model_name, system_instruction=SYSTEM_INSTRUCTIONS,
+                                 generation_config=GENERATION_CONFIG)
+
+
+def wait_for_gemini_slot():
+    """Block until another request fits in the Gemini per-minute quota (thread-safe)"""
+    with _gemini_rate_lock:
+        while True:
+            now = time.monotonic()
+            while _gemini_request_times and now - _gemini_request_times[0] >= 60:
+                _gemini_request_times.popleft()
+            if len(_gemini_request_times) < GEMINI_REQUESTS_PER_MINUTE:
+                _gemini_request_times.append(now)
+                return
+            time.sleep(60 - (now - _gemini_request_times[0]))
+
+
+def _report_rate_limit(retry_state):
+    print(f"⏳ Gemini rate limit hit, retrying in {retry_state.next_action.sleep:.0f}s "
+          f"(attempt {retry_state.attempt_number}/{GEMINI_MAX_ATTEMPTS})...")
+
+
+@retry(
+    retry=retry_if_exception_type(ResourceExhausted),
+    wait=wait_random_exponential(multiplier=1, max=60),
+    stop=stop_after_attempt(GEMINI_MAX_ATTEMPTS),
+    before_sleep=_report_rate_limit,
+    reraise=True,
+)
+def generate_analysis(model, contents):
+    """generate_content behind the client-side rate limit, backing off on 429 ResourceExhausted"""
+    wait_for_gemini_slot()
+    return model.generate_content(contents)
+
+
+def get_model(use_context_cache=False):
+    """Gemini model carrying SYSTEM_INSTRUCTIONS, via the context cache when requested"""
+    global _context_cache_failed
+    if use_context_cache and not _context_cache_failed:
+        try:
+            return get_context_cached_model()
+        except Exception as e:
+            # Typically the instructions are below the API's minimum cacheable size; that won't change
+            # for the life of this process, so stop asking
+            _context_cache_failed = True
+            print(f"⚠️  Context cache unavailable, sending full instructions from now on: {e}")
+    return _get_model(MODEL_NAME)
+
+
+def generate_with_model(contents, use_context_cache=False):
+    """generate_analysis with get_model's model, falling back to full instructions if the context cache is gone"""
+    global _context_cached_model
+    model = get_model(use_context_cache)
+    try:
+        return generate_analysis(model, contents)
+    except (NotFound, PermissionDenied) as e:
+        # The API reports a deleted or expired CachedContent as either of these
+        if model is _get_model(MODEL_NAME):
+            raise
+        print(f"⚠️  Context cache expired on the server, sending full instructions: {e}")
+        _context_cached_model = None  # the next call finds the stored name gone and creates a new cache
+        return generate_analysis(_get_model(MODEL_NAME), contents)
+
+
+def normalize_log(text):
+    """Strip timestamps, hex addresses, hashes and build numbers from log text"""
+    for pattern, replacement in VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def embed_log(log_content):
+    """Embed the normalized log tail for similarity lookups"""
+    result = genai.embed_content(
+        model=EMBEDDING_MODEL,
+        content=normalize_log(log_content)[-EMBEDDING_INPUT_CHARS:],
+        task_type='semantic_similarity',
+    )
+    return result['embedding']
+
+
+def cosine_distance(a, b):
+    """Cosine distance between two equal-length vectors"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return 1.0 - dot / norm if norm else 1.0
+
+
+def _open_semantic_cache():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(SEMANTIC_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses "
+        "(id INTEGER PRIMARY KEY, model TEXT NOT NULL, embedding BLOB NOT NULL, response TEXT NOT NULL)"
+    )
+    return conn
+
+
+def semantic_cache_lookup(model_name, embedding, threshold):
+    """Return (response, distance) for the nearest cached log within threshold, else None"""
+    best = None
+    with closing(_open_semantic_cache()) as conn:
+        rows = conn.execute("SELECT embedding, response FROM responses WHERE model = ?", (model_name,))
+        for blob, response in rows:
+            distance = cosine_distance(embedding, array('f', blob))
+            if best is None or distance < best[1]:
+                best = (response, distance)
+    if best is not None and best[1] < threshold:
+        return decompress_text(best[0]), best[1]
+    return None
+
+
+def semantic_cache_store(model_name, embedding, response):
+    """Remember a response alongside the embedding of the log that produced it, dropping the oldest rows"""
+    with closing(_open_semantic_cache()) as conn, conn:
+        conn.execute(
+            "INSERT INTO responses (model, embedding, response) VALUES (?, ?, ?)",
+            (model_name, array('f', embedding).tobytes(), compress_text(response)),
+        )
+        conn.execute(
+            "DELETE FROM responses WHERE id <= (SELECT id FROM responses ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (SEMANTIC_CACHE_MAX_ROWS,),
+        )
+
+
+def extract_error_windows(text, budget=MAX_LOG_CHARS, ctx=ERROR_CONTEXT_LINES):
+    """Reduce a log to its head, its tail and the most error-dense windows that fit in budget"""
+    if len(text) <= budget:
+        return text
+
+    # Work on line offsets rather than a list of line strings, so only the kept spans are copied
+    line_ends = [m.end() for m in NEWLINE_PATTERN.finditer(text)]
+    if not line_ends or line_ends[-1] < len(text):
+        line_ends.append(len(text))
+    line_count = len(line_ends)
+
+    def line_start(index):
+        return line_ends[index - 1] if index else 0
+
+    def span_chars(start, end):
+        return line_ends[end - 1] - line_start(start) if end > start else 0
+
+    # Merge ±ctx lines around every matching line into windows of (start, end, hits)
+    windows = []
+    hit_lines = sorted({bisect.bisect_right(line_ends, m.start()) for m in ERROR_LINE_PATTERN.finditer(text)})
+    for hit in hit_lines:
+        start, end = max(0, hit - ctx), min(line_count, hit + ctx + 1)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = end
+            windows[-1][2] += 1
+        else:
+            windows.append([start, end, 1])
+
+    # Small budgets (e.g. from fit_to_token_budget) shrink the head and tail allowances with them
+    head_tail_chars = min(HEAD_TAIL_CHARS, budget // 4)
+    head_end = 0
+    while head_end < line_count and span_chars(0, head_end + 1) <= head_tail_chars:
+        head_end += 1
+    remaining = max(0, budget - span_chars(0, head_end) - head_tail_chars)
+
+    # Densest windows first; later ones win ties since failures cluster near the end
+    selected = [(0, head_end)]
+    for start, end, hits in sorted(windows, key=lambda w: (w[2] / (w[1] - w[0]), w[0]), reverse=True):
+        size = span_chars(start, end)
+        if size <= remaining:
+            selected.append((start, end))
+            remaining -= size
+
+    # Whatever budget the windows left over goes to the tail
+    tail_start = line_count
+    tail_budget = head_tail_chars + remaining
+    while tail_start > head_end and span_chars(tail_start - 1, line_count) <= tail_budget:
+        tail_start -= 1
+    selected.append((tail_start, line_count))
+
+    parts, last_end = [], 0
+    for start, end in sorted(selected):
+        start = max(start, last_end)
+        if end <= start:
+            continue
+        if start > last_end:
+            parts.append(f"...[{start - last_end:,} lines omitted]...\n")
+        parts.append(text[line_start(start):line_ends[end - 1]])
+        last_end = end
+    if last_end < line_count:
+        parts.append(f"...[{line_count - last_end:,} lines omitted]...\n")
+        # The last line alone is over budget (minified output, progress bars): keep its end
+        if tail_budget > 0:
+            parts.append(text[-tail_budget:])
+    return "".join(parts)
+
+
+def dedupe_lines(text):
+    """Collapse runs of repeated lines into their first line, suffixed with [×N]"""
+    parts, run_line, run_key, run_count = [], None, None, 0
+
+    def flush():
+        if run_count > 1:
+            body = run_line.rstrip("\n")
+            parts.append(f"{body} [×{run_count}]" + run_line[len(body):])
+        elif run_count:
+            parts.append(run_line)
+
+    for line in text.splitlines(keepends=True):
+        key = normalize_log(line.rstrip("\n"))
+        if not ERROR_LINE_PATTERN.search(key) and not SOURCE_LOCATION_PATTERN.search(key):
+            # Noise (progress ticks, downloads) also repeats when only its numbers differ;
+            # stack frames don't, their line numbers are what locates the error
+            key = DIGITS_PATTERN.sub("<n>", key)
+        if key == run_key:
+            run_count += 1
+            continue
+        flush()
+        run_line, run_key, run_count = line, key, 1
+    flush()
+    return "".join(parts)
+
+
+def count_prompt_tokens(model, text):
+    """Exact token count for text, cached on disk by content hash"""
+    key = 'tokens:' + response_cache_key(model.model_name, text)
+    count = get_response_cache().get(key)
+    if count is None:
+        count = model.count_tokens(text).total_tokens
+        get_response_cache().set(key, count)
+    return count
+
+
+def fit_to_token_budget(model, header, log_content, budget=MAX_PROMPT_TOKENS):
+    """Shrink log_content (keeping its error windows) until header + log fits in budget tokens"""
+    fitted = log_content
+    for _ in range(5):
+        try:
+            tokens = count_prompt_tokens(model, header + fitted)
+        except Exception as e:
+            # No API key or no network: fall back to the usual ~4 characters per token
+            logger.debug("count_tokens unavailable, estimating: %s", e)
+            tokens = len(header + fitted) // 4
+        if tokens <= budget or not fitted:
+            break
+        # Scale the character budget by how far over we are, with a little headroom
+        fitted = extract_error_windows(log_content, budget=int(len(fitted) * budget / tokens * 0.95))
+    return fitted
+
+
+def extract_error_signature(log_content):
+    """Build a normalized signature from the error lines of common CI tools"""
+    lines = []
+    for pattern in ERROR_SIGNATURE_PATTERNS:
+        for match in pattern.finditer(log_content):
+            line = normalize_log(match.group(1).strip())
+            if line not in lines:
+                lines.append(line)
+            if len(lines) >= MAX_SIGNATURE_LINES:
+                return "\n".join(lines)
+    return "\n".join(lines) or None
+
+
+def _template_key(signature):
+    return 'template:' + hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
+
+def lookup_error_template(signature):
+    """Record another sighting of a known signature and return its entry, if any"""
+    cache, key = get_response_cache(), _template_key(signature)
+    # transact() holds a SQLite write lock, so concurrent analyzers (threads or processes) don't lose updates
+    with cache.transact():
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        entry['occurrences'] += 1
+        entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+        cache.set(key, entry)
+    return entry
+
+
+def remember_error_template(signature, analysis):
+    """Store (or revise) the analysis for an error signature"""
+    cache, key = get_response_cache(), _template_key(signature)
+    now = datetime.now().isoformat(timespec='seconds')
+    with cache.transact():
+        entry = cache.get(key) or {
+            'signature': signature,
+            'occurrences': 1,
+            'first_seen': now,
+        }
+        entry['analysis'] = analysis
+        entry['last_seen'] = now
+        cache.set(key, entry)
+
+
+def trivial_classify(log_content):
+    """Canned payload for logs that need no model call (green build, OOM kill, network flake), else None"""
+    signature = extract_error_signature(log_content)
+
+    # Green if Jenkins says so on the last line. Otherwise the run is still going (e.g. post { failure }),
+    # so only Jenkins markup and the analyzer's own command may follow the last success marker:
+    # a deploy step can fail after Maven's BUILD SUCCESS without printing any failure marker
+    last_success = deque(SUCCESS_LINE_PATTERN.finditer(log_content), maxlen=1)
+    match = last_success[0] if last_success else None
+    trailer = log_content[match.end():] if match else ''
+    finished = match and match.group(0).rstrip().endswith('Finished: SUCCESS') and not trailer.strip()
+    if match and (finished or (signature is None
+                               and all(SUCCESS_TRAILER_PATTERN.match(line) for line in trailer.splitlines()))):
+        return json.dumps({
+            'root_cause': "The log reports a successful build, so there is no failure to analyze.",
+            'error_location': f"`{match.group(0).strip()}`",
+            'fixes': [
+                "Check that the right log was attached to the analysis",
+                "If the job was still marked as failed, look at post-build steps and the job configuration",
+            ],
+            'prevention': ["Only run the analyzer from the pipeline's failure handler (e.g. `post { failure { ... } }`)"],
+        })
+
+    # Same guard as for network errors below: an OOM line next to a failing test or compile error is not the cause
+    match = OOM_LINE_PATTERN.search(log_content)
+    oom_only = signature is None or all(OOM_LINE_PATTERN.search(line) for line in signature.splitlines())
+    if match and oom_only and not TEST_FAILURE_PATTERN.search(log_content):
+        return json.dumps({
+            'root_cause': "The build ran out of memory and the process was killed.",
+            'error_location': f"`{match.group(0).strip()}`",
+            'fixes': [
+                "Raise the heap of the failing tool (`-Xmx` in `MAVEN_OPTS` or `org.gradle.jvmargs`, "
+                "`NODE_OPTIONS=--max-old-space-size=...`)",
+                "Give the agent or container more memory, or lower build parallelism (`-T`, `--max-workers`, `-j`)",
+            ],
+            'prevention': [
+                "Set explicit memory limits for build tools instead of relying on defaults",
+                "Track agent memory usage to catch leaking tests before they reach the limit",
+            ],
+        })
+
+    # A network line alone is not enough: any other recognizable failure means the change is at fault
+    match = NETWORK_LINE_PATTERN.search(log_content)
+    network_only = signature is None or all(NETWORK_LINE_PATTERN.search(line) for line in signature.splitlines())
+    if (match and network_only and not BUILD_FAILURE_PATTERN.search(log_content)
+            and not TEST_FAILURE_PATTERN.search(log_content)):
+        return json.dumps({
+            'root_cause': "A network error interrupted the build before any test or compile failure, "
+                          "so this is most likely a transient infrastructure problem rather than the change.",
+            'error_location': f"`{match.group(0).strip()}`",
+            'fixes': [
+                "Re-run the build",
+                "If it keeps failing, check that the host in the error (artifact repository, registry, proxy) is reachable",
+            ],
+            'prevention': [
+                "Serve dependencies from a local mirror or cache",
+                "Enable retries for dependency downloads",
+            ],
+        })
+    return None
+
+
+def read_log_file(log_path, max_bytes=64 * 1024):
+    """Read the tail of the build log, at most max_bytes from the end"""
+    try:
+        with open(log_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            f.seek(-min(size, max_bytes), os.SEEK_END)
+            data = memoryview(f.read())
+        if size > max_bytes:
+            # Drop the partial line we seeked into, without copying the rest of the buffer
+            data = data[data.obj.find(b'\n') + 1:]
+        content = str(data, 'utf-8', errors='ignore')
+        if '\r' not in content:
+            return content
+        return content.replace('\r\n', '\n').replace('\r', '\n')
+    except FileNotFoundError:
+        raise LogReadError(f"Log file not found at {log_path}")
+    except (OSError, ValueError) as e:
+        raise LogReadError(f"Error reading log file: {e}")
+
+
+def render_analysis(data):
+    """Render a structured analysis as the Markdown report sections"""
+    sections = [
+        f"## 🔍 Root Cause\n{data['root_cause']}",
+        f"## 📍 Error Location\n{data['error_location']}",
+        "## 🔧 Recommended Fixes\n" + "\n".join(f"{i}. {fix}" for i, fix in enumerate(data['fixes'], 1)),
+        "## 💡 Prevention Tips\n" + "\n".join(f"- {tip}" for tip in data['prevention']),
+    ]
+    if data.get('refs'):
+        sections.append("## 🔗 Relevant Documentation\n" + "\n".join(f"- {ref}" for ref in data['refs']))
+    return "\n\n".join(sections) + "\n"
+
+
+def render_payload(payload):
+    """Markdown for a cached or fresh payload; non-JSON payloads (errors, older caches) pass through"""
+    try:
+        return render_analysis(json.loads(payload))
+    except (ValueError, TypeError, KeyError):
+        return payload
+
+
+def emit(text, sinks):
+    """Write text to every sink (console, output file) as soon as it is available"""
+    for sink in sinks:
+        sink.write(text)
+        sink.flush()
+    return text
+
+
+def analyze_with_gemini(log_content, max_chars=MAX_LOG_CHARS, use_cache=True,
+                        similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD, use_context_cache=False,
+                        token_budget=MAX_PROMPT_TOKENS, sinks=()):
+    """Analyze build log using Gemini AI; writes Markdown to sinks, returns the JSON payload (Markdown if reused)"""
+    # Reduce if too long, keeping the parts of the log around errors
+    log_chars = len(log_content)
+    if log_chars > max_chars:
+        print(f"⚠️  Log reduced from {log_chars:,} to {max_chars:,} characters around errors")
+        log_content = extract_error_windows(log_content, budget=max_chars)
+
+    deduped = dedupe_lines(log_content)
+    if len(deduped) < len(log_content):
+        print(f"🧹 Collapsed repeated log lines ({len(log_content):,} → {len(deduped):,} characters)")
+        log_content = deduped
+
+    api_key = os.getenv('GEMINI_API_KEY')
+    if api_key:
+        configure_gemini(api_key)
+
+    # Only the log varies between calls; the instructions go in SYSTEM_INSTRUCTIONS
+    log_header = "\nBuild Log:\n---\n"
+    fitted = fit_to_token_budget(_get_model(MODEL_NAME), log_header, log_content, budget=token_budget)
+    if len(fitted) < len(log_content):
+        print(f"⚠️  Log reduced further to fit {token_budget:,} prompt tokens")
+        log_content = fitted
+    log_block = log_header + log_content + "\n---\n"
+    prompt = SYSTEM_INSTRUCTIONS + log_block
+
+    # First tier: exact match on the prompt
+    key = response_cache_key(MODEL_NAME, prompt)
+    if use_cache:
+        cached = get_response_cache().get(key)
+        if cached is not None:
+            cached = decompress_text(cached)
+            logger.debug("Response cache hit: %s", key)
+            print("⚡ Reusing cached analysis for this log")
+            emit(render_payload(cached), sinks)
+            return cached
+        logger.debug("Response cache miss: %s", key)
+
+    if not api_key:
+        return emit("❌ Error: GEMINI_API_KEY environment variable not set", sinks)
+
+    # Second tier: reuse the analysis of a near-identical earlier log
+    embedding = None
+    if use_cache and similarity_threshold > 0:
+        try:
+            embedding = embed_log(log_content)
+            match = semantic_cache_lookup(MODEL_NAME, embedding, similarity_threshold)
+        except Exception as e:
+            logger.debug("Semantic cache unavailable: %s", e)
+            match = None
+        if match is not None:
+            response_text, distance = match
+            logger.debug("Semantic cache hit (distance %.3f)", distance)
+            print(f"⚡ Reusing analysis of a similar log (distance {distance:.3f})")
+            # Rendered with its header, so exact hits and templates built from it keep the marker too
+            reused = emit(f"> ⚡ reused analysis of a similar log (distance {distance:.3f})\n\n"
+                          f"{render_payload(response_text)}", sinks)
+            get_response_cache().set(key, compress_text(reused))
+            return reused
+        logger.debug("Semantic cache miss")
+
+    try:
+        print("🤖 Analyzing build log with Gemini AI...")
+        # The JSON has to be complete before it can be rendered, so the response is not streamed
+        response_text = generate_with_model(log_block, use_context_cache).text
+        emit(render_payload(response_text), sinks)
+
+        if use_cache:
+            get_response_cache().set(key, compress_text(response_text))
+            if embedding is not None:
+                semantic_cache_store(MODEL_NAME, embedding, response_text)
+        return response_text
+
+    except Exception as e:
+        error_msg = f"""
+❌ **Error during AI analysis**
+```
+{str(e)}
+```
+
+**Possible causes:**
+- API key invalid or expired
+- Network connectivity issues
+- API rate limit exceeded
+- Model unavailable
+
+**Please check:**
+1. Verify GEMINI_API_KEY is set correctly
+2. Check network connectivity
+3. Visit https://aistudio.google.com to verify API status
+"""
+        return emit(error_msg, sinks)
+
+
+def analyze_build_log(log_content, use_cache=True, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                      use_context_cache=False, sinks=()):
+    """Reuse the analysis of a known error signature, falling back to Gemini; returns Markdown"""
+    payload = trivial_classify(log_content)
+    if payload is not None:
+        print("⚡ Log matches a known trivial pattern, skipping Gemini")
+        return emit(f"> ⚡ built-in pattern match, Gemini was not called\n\n{render_payload(payload)}", sinks)
+
+    signature = extract_error_signature(log_content) if use_cache else None
+    entry = None
+    if signature:
+        try:
+            entry = lookup_error_template(signature)
+        except (OSError, sqlite3.Error, diskcache.Timeout) as e:
+            # The template store is an optimization; fall through to Gemini without it
+            logger.debug("Template store unavailable: %s", e)
+
+    if entry is not None and entry['occurrences'] % TEMPLATE_REVISION_INTERVAL != 0:
+        print(f"⚡ Known error signature (seen {entry['occurrences']} times), skipping Gemini")
+        return emit(f"> ⚡ cached template match (seen {entry['occurrences']} times)\n\n"
+                    f"{render_payload(entry['analysis'])}", sinks)
+
+    if entry is not None:
+        # Periodically re-run the model so stored analyses don't go stale
+        print(f"🔄 Revising stored analysis for known error signature (seen {entry['occurrences']} times)")
+        payload = analyze_with_gemini(log_content, use_cache=False,
+                                      use_context_cache=use_context_cache, sinks=sinks)
+    else:
+        payload = analyze_with_gemini(log_content, use_cache=use_cache,
+                                      similarity_threshold=similarity_threshold,
+                                      use_context_cache=use_context_cache, sinks=sinks)
+
+    if signature and not payload.lstrip().startswith('❌'):
+        try:
+            remember_error_template(signature, payload)
+        except (OSError, sqlite3.Error, diskcache.Timeout) as e:
+            logger.debug("Template store unavailable: %s", e)
+    return render_payload(payload)
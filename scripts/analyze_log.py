@@ -1,12 +1,47 @@
 #!/usr/bin/env python3
-import os, sys, json, requests, textwrap
+import io, os, sys, json, time, atexit, random, hashlib, logging, textwrap, httpx, diskcache
+from collections import deque
 
-def read_log(path):
-    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-        return f.read()
+CACHE_DIR = os.path.expanduser(os.getenv("LOG_ANALYZER_CACHE_DIR", "~/.cache/ai-log-analyzer"))
+MAX_LOG_TOKENS = 8000
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 60
+log = logging.getLogger(__name__)
 
-def make_prompt(log_text):
-    log_tail = "\n".join(log_text.splitlines()[-2000:])
+# offline token estimate; cl100k is not Gemini's tokenizer but is close enough for budgeting
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# one pooled HTTP/2 client for every call; the transport retries failed connects, post_with_retries the rest
+_CLIENT = httpx.Client(http2=True, timeout=60.0, transport=httpx.HTTPTransport(http2=True, retries=3))
+atexit.register(_CLIENT.close)
+
+def read_log_tail(path, n=2000, block_size=64 * 1024):
+    # walk backwards from EOF in blocks until we hold n lines, then keep exactly the last n
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        blocks, newlines = [], 0
+        while pos > 0 and newlines <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            blocks.append(f.read(step))
+            newlines += blocks[-1].count(b"\n")
+    text = b"".join(reversed(blocks)).decode("utf-8", errors="ignore")
+    return "".join(deque(io.StringIO(text), maxlen=n))
+
+def fit_to_token_budget(log_tail, budget=MAX_LOG_TOKENS):
+    if _ENCODING is None:
+        return log_tail[-budget * 4:]
+    tokens = _ENCODING.encode(log_tail, disallowed_special=())
+    return _ENCODING.decode(tokens[-budget:]) if len(tokens) > budget else log_tail
+
+def make_prompt(log_tail):
+    log_tail = fit_to_token_budget(log_tail)
     prompt = textwrap.dedent(f"""
       You are an assistant that analyzes CI build logs. Provide:
       1) Short summary
@@ -19,36 +54,80 @@ def make_prompt(log_text):
     """)
     return prompt
 
-def call_gemini(prompt, api_key, model="gemini-1.5-flash-latest"):
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+def emit(text, sinks):
+    for sink in sinks:
+        sink.write(text)
+        sink.flush()
+    return text
+
+def post_with_retries(url, **kwargs):
+    # returns an open streaming response; retries 429/5xx, honoring Retry-After, else full-jitter backoff
+    for attempt in range(MAX_RETRIES + 1):
+        resp = _CLIENT.send(_CLIENT.build_request("POST", url, **kwargs), stream=True)
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return resp
+        retry_after = resp.headers.get("Retry-After", "")
+        delay = float(retry_after) if retry_after.isdigit() else random.uniform(0, min(MAX_RETRY_DELAY, 2 ** attempt))
+        if delay > MAX_RETRY_DELAY:
+            # quota exhausted for longer than a CI job should sit idle: report the status instead
+            return resp
+        resp.close()
+        print(f"HTTP {resp.status_code}, retrying in {delay:.0f}s...", file=sys.stderr)
+        time.sleep(delay)
+
+def call_gemini(prompt, api_key, model="gemini-1.5-flash-latest", use_cache=True, sinks=()):
+    key = hashlib.sha256((model + "\x00" + prompt).encode("utf-8")).hexdigest()
+    if use_cache:
+        with diskcache.Cache(CACHE_DIR) as cache:
+            if key in cache:
+                log.debug("cache hit %s", key)
+                return emit(cache[key], sinks)
+        log.debug("cache miss %s", key)
+    # server-sent events: one JSON chunk per "data:" line as the model decodes
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
     headers = {"Content-Type": "application/json"}
     payload = {"contents":[{"parts":[{"text": prompt}]}], "temperature":0.0}
-    resp = requests.post(url, params={"key": api_key}, headers=headers, json=payload, timeout=60)
-    resp.raise_for_status()
-    data = resp.json()
-    if "candidates" in data:
-        return data["candidates"][0]["content"]["parts"][0]["text"]
-    return json.dumps(data, indent=2)
+    resp = post_with_retries(url, params={"key": api_key, "alt": "sse"}, headers=headers, json=payload)
+    parts, data = [], {}
+    try:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = json.loads(line[len("data:"):])
+            for candidate in data.get("candidates", [])[:1]:
+                for part in candidate.get("content", {}).get("parts", []):
+                    parts.append(emit(part.get("text", ""), sinks))
+    finally:
+        resp.close()
+    if not parts:
+        return emit(json.dumps(data, indent=2), sinks)
+    text = "".join(parts)
+    if use_cache:
+        with diskcache.Cache(CACHE_DIR) as cache:
+            cache[key] = text
+    return text
 
 def main():
-    if len(sys.argv) < 2:
-        print("usage: analyze_log.py <logfile> [outfile]")
+    logging.basicConfig(level=os.getenv("LOG_ANALYZER_LOG_LEVEL", "WARNING").upper())
+    args = [a for a in sys.argv[1:] if a != "--no-cache"]
+    use_cache = "--no-cache" not in sys.argv and os.getenv("LOG_ANALYZER_NO_CACHE", "").lower() not in ("1", "true", "yes")
+    if len(args) < 1:
+        print("usage: analyze_log.py <logfile> [outfile] [--no-cache]")
         sys.exit(1)
-    log_path = sys.argv[1]
-    out_path = sys.argv[2] if len(sys.argv) > 2 else "analysis.txt"
-    log = read_log(log_path)
-    prompt = make_prompt(log)
+    log_path = args[0]
+    out_path = args[1] if len(args) > 1 else "analysis.txt"
+    prompt = make_prompt(read_log_tail(log_path))
     api_key = os.getenv("AI_API_KEY")
     if not api_key:
         print("ERROR: AI_API_KEY not set")
         sys.exit(1)
-    try:
-        analysis = call_gemini(prompt, api_key)
-    except Exception as e:
-        analysis = f"ERROR calling Gemini API: {e}"
     with open(out_path, 'w', encoding='utf-8') as f:
-        f.write(analysis)
-    print(analysis)
+        try:
+            call_gemini(prompt, api_key, use_cache=use_cache, sinks=(sys.stdout, f))
+        except Exception as e:
+            emit(f"ERROR calling Gemini API: {e}", (sys.stdout, f))
+    print()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# thin client for analyze_service.py: no Gemini import, one POST to the already-running service
+import os, sys, httpx
+
+SERVICE_URL = os.getenv("LOG_ANALYZER_SERVICE_URL", "http://localhost:8787")
+SERVICE_TOKEN = os.getenv("LOG_ANALYZER_SERVICE_TOKEN", "")
+FLAGS = ("--no-cache", "--compress", "--use-context-cache")
+
+def main():
+    args = [a for a in sys.argv[1:] if a not in FLAGS]
+    if len(args) < 3:
+        print("usage: request_analysis.py <logfile> <owner/repo> <pr_number> [outfile] [--no-cache] [--compress]")
+        sys.exit(1)
+    # paths are resolved here because the service runs with its own working directory
+    job = {"log": os.path.abspath(args[0]), "repo": args[1], "pr": args[2],
+           "out": os.path.abspath(args[3] if len(args) > 3 else "analysis.txt")}
+    job.update({flag[2:].replace("-", "_"): True for flag in FLAGS if flag in sys.argv})
+    try:
+        # no timeout: the service answers after Gemini (and any rate-limit waits) and the PR comment
+        resp = httpx.post(f"{SERVICE_URL}/analyze", json=job, timeout=None,
+                          headers={"Authorization": f"Bearer {SERVICE_TOKEN}"})
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        print(f"ERROR: analyzer service returned {e.response.status_code}: {e.response.text}")
+        sys.exit(1)
+    except httpx.HTTPError as e:
+        print(f"ERROR calling analyzer service at {SERVICE_URL}: {e}")
+        sys.exit(1)
+    result = resp.json()
+    print(result["analysis"])
+    print(f"saved to {result['output']}; PR comment {'posted' if result['posted'] else 'FAILED'}")
+    sys.exit(0 if result["posted"] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Regression logs for trivial_classify: which logs are answered without calling Gemini
+Run with: python -m pytest test_trivial_classify.py
+"""
+
+import json
+import pytest
+from log_analyzer_core import trivial_classify
+
+
+# Failures that merely mention success, memory or the network: these must go to Gemini
+GEMINI_LOGS = {
+    'deploy fails after gradle success': """\
+BUILD SUCCESSFUL in 12s
++ ./deploy.sh
+./deploy.sh: line 3: kubectl: command not found
+[Pipeline] { (Declarative: Post Actions)
+""",
+    'docker push denied after maven success': """\
+[INFO] BUILD SUCCESS
+[INFO] ------------------------------------------------------------------------
++ docker push registry.example.com/app:1.4.2
+The push refers to repository [registry.example.com/app]
+denied: requested access to the resource is denied
+""",
+    'gradle compile failure with read timeout': """\
+> Task :compileJava FAILED
+Could not GET 'https://repo.maven.apache.org/maven2/org/foo/1.0/foo-1.0.pom'. Read timed out
+
+FAILURE: Build failed with an exception.
+""",
+    'npm missing module with connection reset': """\
+npm WARN network ECONNRESET while fetching https://registry.npmjs.org/left-pad
+Error: Cannot find module 'express'
+Require stack:
+- /app/server.js
+""",
+    'python import error with connection timeout': """\
+pip: Connection timed out while fetching index, using cached wheels
+Traceback (most recent call last):
+  File "app.py", line 1, in <module>
+    import requests
+ModuleNotFoundError: No module named 'requests'
+""",
+    'gcc error with curl timeout': """\
+curl: (28) Connection timed out after 30001 milliseconds
+src/main.c:42:5: error: 'foo' undeclared (first use in this function)
+make: *** [Makefile:12: main.o] Error 1
+""",
+    'pytest memory error': """\
+tests/test_buf.py F
+E       MemoryError
+FAILED tests/test_buf.py::test_grow - MemoryError
+""",
+}
+
+GREEN_LOGS = {
+    'jenkins finished success': """\
+[INFO] BUILD SUCCESS
+[Pipeline] End of Pipeline
+Finished: SUCCESS
+""",
+    'analyzer run from the pipeline after success': """\
+BUILD SUCCESSFUL in 40s
+[Pipeline] }
+[Pipeline] // stage
+[Pipeline] sh
++ python3 analyze_log.py build.log analysis.txt
+""",
+}
+
+OOM_LOGS = {
+    'java heap': 'Exception in thread "main" java.lang.OutOfMemoryError: Java heap space\n',
+    'kernel oom killer': 'Out of memory: Killed process 4242 (java) total-vm:8388608kB\n'
+                         'script returned exit code 137\n',
+}
+
+NETWORK_LOGS = {
+    'dns failure': "fatal: unable to access 'https://github.com/org/repo.git/': Could not resolve host: github.com\n",
+}
+
+
+def root_cause(log):
+    payload = trivial_classify(log)
+    return payload and json.loads(payload)['root_cause']
+
+
+@pytest.mark.parametrize('log', GEMINI_LOGS.values(), ids=GEMINI_LOGS.keys())
+def test_real_failures_go_to_gemini(log):
+    assert trivial_classify(log) is None
+
+
+@pytest.mark.parametrize('log', GREEN_LOGS.values(), ids=GREEN_LOGS.keys())
+def test_green_builds(log):
+    assert 'successful build' in root_cause(log)
+
+
+@pytest.mark.parametrize('log', OOM_LOGS.values(), ids=OOM_LOGS.keys())
+def test_out_of_memory(log):
+    assert 'out of memory' in root_cause(log)
+
+
+@pytest.mark.parametrize('log', NETWORK_LOGS.values(), ids=NETWORK_LOGS.keys())
+def test_network_flakes(log):
+    assert 'network error' in root_cause(log)